@@ -1,4 +1,5 @@
 import http.server
+import threading
 from urllib.parse import parse_qs, urlparse
 
 
@@ -6,21 +7,46 @@ class OAuthCallbackHandler(http.server.BaseHTTPRequestHandler):
     """Handles the OAuth callback and extracts the authorization code."""
 
     callback_code = None
+    callback_error = None
+    expected_state = None
+    callback_received = threading.Event()
+
+    def log_message(self, format, *args):
+        # silence per-request access logs on stderr
+        pass
+
+    def address_string(self):
+        # skip the reverse DNS lookup on the client address
+        return self.client_address[0]
 
     def do_GET(self):
         # parse callback url
         url = urlparse(self.path)
         params = parse_qs(url.query)
 
-        if "code" in params:
+        is_callback = "code" in params or "error" in params
+        if is_callback and params.get("state", [""])[0] != self.expected_state:
+            # reject callbacks not tied to our auth request
+            self.send_response(400)
+            self.end_headers()
+            self.wfile.write(b"Invalid state parameter in the callback URL.")
+        elif "code" in params:
             OAuthCallbackHandler.callback_code = params["code"][0]
+            OAuthCallbackHandler.callback_received.set()
 
             # mark as success
             self.send_response(200)
             self.send_header("Content-type", "text/html")
             self.end_headers()
             self.wfile.write(b"Authorization successful! You can close this window.")
-        else:
+        elif "error" in params:
+            OAuthCallbackHandler.callback_error = params["error"][0]
+            OAuthCallbackHandler.callback_received.set()
+
             self.send_response(400)
             self.end_headers()
-            self.wfile.write(b"Missing authorization code in the callback URL.")
+            self.wfile.write(b"Authorization failed. You can close this window.")
+        else:
+            # favicon, prefetch, and other stray requests; keep waiting for the real callback
+            self.send_response(404)
+            self.end_headers()
@@ -1,21 +1,29 @@
+import asyncio
 import logging
-import sys
-import json
+import os
+import orjson
 import secrets
-import socketserver
-from urllib.parse import urlencode
+import tempfile
+import threading
+import time
+import http.server
+from urllib.parse import urlencode, urlparse
 import webbrowser
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from ..auth import OAuthCallbackHandler
 
-## -- LOGGING CONFIG -- ##
-logging.basicConfig(
-    level=logging.DEBUG,  # Show DEBUG and above
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-    handlers=[logging.StreamHandler(sys.stdout)],
-)
+# httpx is only needed by the async a_* methods, so it's imported lazily there
+if TYPE_CHECKING:
+    import httpx
 
+## -- LOGGING CONFIG -- ##
+# handlers/levels are left to the application (see notebooks for an example setup)
 logger = logging.getLogger(__name__)
 
 
@@ -31,8 +39,72 @@ class Whoop:
         "read:profile",
         "offline",
     ]
+    _SCOPE_STR = " ".join(SCOPES)
     STATE = secrets.token_urlsafe(16)
     BASE_URL = "https://api.prod.whoop.com/developer/v2"
+    AUTH_URL = "https://api.prod.whoop.com/oauth/oauth2/auth"
+    TOKEN_URL = "https://api.prod.whoop.com/oauth/oauth2/token"
+    _RECORD_URLS = {
+        "sleep": f"{BASE_URL}/activity/sleep",
+        "workout": f"{BASE_URL}/activity/workout",
+        "profile": f"{BASE_URL}/user/profile/basic",
+        "recovery": f"{BASE_URL}/recovery",
+    }
+    _PAGE_LIMIT = 25  # max page size accepted by the collection endpoints
+
+    # shared http session, reused across calls for keep-alive / connection pooling
+    _session: requests.Session | None = None
+
+    # serializes token refreshes so concurrent 401s only hit the token endpoint once
+    _refresh_lock = threading.Lock()
+    _REFRESH_MARGIN = 300  # refresh this many seconds before the access token expires
+    _scheduler_thread: threading.Thread | None = None
+    _scheduler_stop = threading.Event()
+
+    # (path, st_mtime_ns, st_ino, config) for the last loaded config.json, assigned as one
+    # tuple so concurrent loads of different paths can't mix their fields
+    _config_cache: tuple[str, int, int, dict] | None = None
+    _config_write_lock = threading.Lock()
+
+    # (access_token, Authorization header) pair, rebuilt whenever the token changes
+    _auth_header: tuple[str, dict] | None = None
+
+    @classmethod
+    def _get_session(cls) -> requests.Session:
+        """
+        Lazily builds a single requests.Session shared by every WHOOP call so back-to-back
+        requests reuse pooled connections instead of paying a fresh TLS handshake each time.
+        """
+        if cls._session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=16,
+                # return the final 5xx response rather than raising, so callers keep
+                # their existing status-code handling
+                max_retries=Retry(
+                    total=3,
+                    backoff_factor=0.2,
+                    status_forcelist=[502, 503, 504],
+                    raise_on_status=False,
+                ),
+            )
+            session.mount("https://", adapter)
+            cls._session = session
+        return cls._session
+
+    @classmethod
+    def _new_async_client(cls) -> "httpx.AsyncClient":
+        """
+        Builds a pooled httpx.AsyncClient for the a_* methods. Clients are bound to the event
+        loop they are used on, so callers scope one per loop with `async with` rather than
+        caching it on the class like the sync session.
+        """
+        import httpx
+
+        return httpx.AsyncClient(
+            limits=httpx.Limits(max_keepalive_connections=8, max_connections=16),
+        )
 
     @classmethod
     def _fetch_access_token(cls, config_filepath: str = "config.json") -> str | None:
@@ -45,6 +117,20 @@ class Whoop:
             return None
         return config.get("access_token")
 
+    @classmethod
+    def _get_auth_header(cls, config_filepath: str = "config.json") -> dict:
+        access_token = cls._fetch_access_token(config_filepath)
+        if access_token is None:
+            return {}
+
+        # the header is cached alongside the token it was built from, so a refresh
+        # landing mid-call can never leave a stale header behind
+        cached = cls._auth_header
+        if cached is None or cached[0] != access_token:
+            cached = (access_token, {"Authorization": f"Bearer {access_token}"})
+            cls._auth_header = cached
+        return cached[1]
+
     @classmethod
     def _load_config(cls, config_filepath: str = "config.json") -> dict:
         """
@@ -56,88 +142,182 @@ class Whoop:
             "client_secret": "",
             "redirect_uri": "",
             "access_token": null,
-            "refresh_token": null
+            "refresh_token": null,
+            "expires_at": null
         }
 
         Where client_id, client_secret, and redirect_uri are obtained/set via WHOOP developer dashboard
         on a by-project basis
 
-        Access and refresh tokens are obtained via OAuth2 flow and can be null initially
+        Access and refresh tokens are obtained via OAuth2 flow and can be null initially. expires_at
+        is the unix timestamp at which the access token expires, set alongside the tokens
+
+        The parsed config is cached in memory and only re-read when the file changes on disk.
         """
         try:
-            with open(config_filepath, "r") as f:
-                config = json.load(f)
-            logger.debug(f"Configuration loaded from {config_filepath}")
-            return config
+            # inode catches os.replace swaps that coarse mtimes would miss
+            st = os.stat(config_filepath)
+            key = (config_filepath, st.st_mtime_ns, st.st_ino)
+            cached = cls._config_cache
+            if cached is not None and cached[:3] == key:
+                return dict(cached[3])
+
+            with open(config_filepath, "rb") as f:
+                config = orjson.loads(f.read())
+            logger.debug("Configuration loaded from %s", config_filepath)
+
+            cls._config_cache = (*key, config)
+            return dict(config)
         except FileNotFoundError:
             logger.error(f"Configuration file {config_filepath} not found.")
             return {}
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             logger.error(f"Error decoding JSON from {config_filepath}: {e}")
             return {}
         except Exception as e:
             logger.error(f"Unexpected error loading config: {e}")
             return {}
 
+    @classmethod
+    def _save_config(cls, config: dict, config_filepath: str = "config.json") -> None:
+        """
+        Atomically writes the config to disk and refreshes the in-memory cache so subsequent
+        loads see the new values without re-reading the file.
+        """
+        # write to a uniquely named temp file in the same directory and swap it in, so a
+        # crash mid-write never leaves a truncated config behind
+        config_dir, config_name = os.path.split(os.path.abspath(config_filepath))
+        with cls._config_write_lock:
+            fd, tmp_filepath = tempfile.mkstemp(
+                dir=config_dir, prefix=f"{config_name}.", suffix=".tmp"
+            )
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(orjson.dumps(config, option=orjson.OPT_INDENT_2))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_filepath, config_filepath)
+            except BaseException:
+                os.remove(tmp_filepath)
+                raise
+
+            st = os.stat(config_filepath)
+            cls._config_cache = (
+                config_filepath,
+                st.st_mtime_ns,
+                st.st_ino,
+                dict(config),
+            )
+
     @classmethod
     def _get_callback_code(
-        cls, port: int = 8080, config_filepath: str = "config.json"
-    ) -> str:
-        with socketserver.TCPServer(("", port), OAuthCallbackHandler) as httpd:
+        cls, port: int = 8080, config_filepath: str = "config.json", timeout: int = 300
+    ) -> tuple[str | None, str]:
+        """
+        Opens the WHOOP authorization page and serves the OAuth callback locally, returning
+        the authorization code and the redirect_uri it was issued for. Pass port=0 to let the
+        OS pick a free port; the redirect_uri is then rewritten to use the bound port, which
+        WHOOP must accept as a loopback redirect on any port.
+        """
+        with http.server.ThreadingHTTPServer(
+            ("127.0.0.1", port), OAuthCallbackHandler
+        ) as httpd:
             # load params
-            params = cls._load_config()
+            params = cls._load_config(config_filepath)
+
+            redirect_uri = params["redirect_uri"]
+            if port == 0:
+                bound_port = httpd.server_address[1]
+                parsed = urlparse(redirect_uri)
+                redirect_uri = parsed._replace(
+                    netloc=f"{parsed.hostname}:{bound_port}"
+                ).geturl()
 
             # make auth specific params object
             auth_params = {
                 "client_id": params["client_id"],
-                "redirect_uri": params["redirect_uri"],
-                "scope": " ".join(cls.SCOPES),
+                "redirect_uri": redirect_uri,
+                "scope": cls._SCOPE_STR,
                 "state": cls.STATE,
                 "response_type": "code",
             }
 
             # build auth url from params
-            url = (
-                f"https://api.prod.whoop.com/oauth/oauth2/auth?{urlencode(auth_params)}"
-            )
+            url = f"{cls.AUTH_URL}?{urlencode(auth_params)}"
+
+            # clear results from any previous attempt
+            OAuthCallbackHandler.callback_code = None
+            OAuthCallbackHandler.callback_error = None
+            OAuthCallbackHandler.expected_state = cls.STATE
+            OAuthCallbackHandler.callback_received.clear()
+
+            # serve in the background; browsers may send favicon/prefetch requests before
+            # the real callback, so keep serving until it arrives or we hit the deadline
+            server_thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+            server_thread.start()
 
             # redirect for user auth
             webbrowser.open(url)
-            httpd.handle_request()
 
-            return OAuthCallbackHandler.callback_code
+            received = OAuthCallbackHandler.callback_received.wait(timeout)
+            httpd.shutdown()
+
+            if not received:
+                logger.error(f"Timed out after {timeout}s waiting for OAuth callback.")
+            elif OAuthCallbackHandler.callback_error is not None:
+                logger.error(
+                    f"Authorization failed: {OAuthCallbackHandler.callback_error}"
+                )
+
+            return OAuthCallbackHandler.callback_code, redirect_uri
+
+    @classmethod
+    def _store_tokens(cls, params: dict, body: dict, config_filepath: str) -> None:
+        """Applies a successful token response to the config and saves it."""
+        expires_in = body.get("expires_in")
+        params["access_token"] = body.get("access_token")
+        params["refresh_token"] = body.get("refresh_token")
+        params["expires_at"] = time.time() + expires_in if expires_in else None
+
+        cls._save_config(params, config_filepath)
 
     @classmethod
-    def init_auth_flow(cls, config_filepath: str = "config.json"):
+    def init_auth_flow(
+        cls, config_filepath: str = "config.json", port: int = 8080, timeout: int = 300
+    ):
         """
         For first time users, initialize a full OAuth2 authetication flow to obtain access
         and refresh tokens. On authorization, the config.json file will be updated with the
         obtained values.
+
+        The callback is served on 127.0.0.1:`port`, waiting up to `timeout` seconds. port=0
+        lets the OS pick a free port, which only works if the WHOOP app accepts a loopback
+        redirect_uri on any port.
         """
 
         # load params
         params = cls._load_config(config_filepath)
 
-        # add grant type and code
-        params["grant_type"] = "authorization_code"
-        params["code"] = cls._get_callback_code(config_filepath)
-
-        # request tokens
-        res = requests.post(
-            url="https://api.prod.whoop.com/oauth/oauth2/token", data=params
+        code, redirect_uri = cls._get_callback_code(
+            port=port, config_filepath=config_filepath, timeout=timeout
         )
-        res.raise_for_status()
+        if code is None:
+            logger.error("No authorization code received, aborting auth flow.")
+            return None
 
-        # remove request specific attributes
-        params.pop("grant_type")
-        params.pop("code")
+        # request tokens, using the redirect_uri the code was issued for
+        token_payload = {
+            "grant_type": "authorization_code",
+            "code": code,
+            "client_id": params["client_id"],
+            "client_secret": params["client_secret"],
+            "redirect_uri": redirect_uri,
+        }
+        res = cls._get_session().post(url=cls.TOKEN_URL, data=token_payload)
+        res.raise_for_status()
 
         # update config with new values
-        params["access_token"] = res.json().get("access_token")
-        params["refresh_token"] = res.json().get("refresh_token")
-
-        with open(config_filepath, "w") as f:
-            json.dump(params, f, indent=4)
+        cls._store_tokens(params, orjson.loads(res.content), config_filepath)
 
         logger.info(
             "Authentication flow complete. Access and refresh tokens saved to config."
@@ -170,63 +350,318 @@ class Whoop:
 
     @classmethod
     def refresh_access_tokens(cls, config_filepath: str = "config.json") -> None:
-        params = cls._load_config(config_filepath)
+        """
+        Exchanges the stored refresh token for a new access/refresh token pair. Safe to call
+        from multiple threads; callers that were waiting while another thread refreshed the
+        same config reuse that result rather than re-POSTing a now-stale refresh token.
+        """
+        # the refresh token this caller saw, to detect a refresh that landed while waiting
+        seen_refresh_token = cls._load_config(config_filepath).get("refresh_token")
+
+        with cls._refresh_lock:
+            # re-read under the lock so we use the latest refresh token
+            params = cls._load_config(config_filepath)
+            if params.get("refresh_token") != seen_refresh_token:
+                logger.debug("Tokens already refreshed by another caller, skipping.")
+                return None
+
+            # set request params
+            refresh_params = {
+                "grant_type": "refresh_token",
+                "client_id": params.get("client_id"),
+                "client_secret": params.get("client_secret"),
+                "scope": "offline",
+                "refresh_token": params.get("refresh_token"),
+            }
 
-        # set request params
-        refresh_params = {
-            "grant_type": "refresh_token",
-            "client_id": params.get("client_id"),
-            "client_secret": params.get("client_secret"),
-            "scope": "offline",
-            "refresh_token": params.get("refresh_token"),
-        }
+            # request new tokens
+            res = cls._get_session().post(url=cls.TOKEN_URL, data=refresh_params)
+
+            # keep the existing tokens on failure rather than overwriting them with nulls
+            if res.status_code != 200:
+                logger.error(f"Error refreshing access tokens: {res.text}")
+                return None
+
+            cls._store_tokens(params, orjson.loads(res.content), config_filepath)
+
+    @classmethod
+    async def a_refresh_access_tokens(
+        cls, config_filepath: str = "config.json"
+    ) -> None:
+        """
+        Async version of refresh_access_tokens. Runs the sync refresh in a worker thread so
+        async and sync callers (e.g. the refresh scheduler) serialize on the same lock.
+        """
+        await asyncio.to_thread(cls.refresh_access_tokens, config_filepath)
+
+    @classmethod
+    def _needs_refresh(cls, config_filepath: str = "config.json") -> bool:
+        """
+        Whether the access token expires within the refresh margin. Configs without an
+        expires_at (pre-dating it) are left to the reactive 401 refresh.
+        """
+        expires_at = cls._load_config(config_filepath).get("expires_at")
+        if expires_at is None:
+            return False
+        return expires_at - time.time() < cls._REFRESH_MARGIN
+
+    @classmethod
+    def _maybe_refresh(cls, config_filepath: str = "config.json") -> None:
+        """Refreshes tokens if the access token expires within the refresh margin."""
+        if cls._needs_refresh(config_filepath):
+            logger.info("Access token near expiry, refreshing...")
+            cls.refresh_access_tokens(config_filepath)
+
+    @classmethod
+    def start_refresh_scheduler(
+        cls, interval: int = 60, config_filepath: str = "config.json"
+    ) -> None:
+        """
+        Starts a daemon thread that checks token expiry every `interval` seconds and refreshes
+        ahead of time, keeping refreshes off the get_records call path. Call once at app
+        startup; the 401 refresh in get_records remains as a fallback.
+        """
+        if cls._scheduler_thread is not None and cls._scheduler_thread.is_alive():
+            logger.debug("Refresh scheduler already running.")
+            return None
 
-        # request new tokens
-        res = requests.post(
-            url="https://api.prod.whoop.com/oauth/oauth2/token", data=refresh_params
+        def _run() -> None:
+            while not cls._scheduler_stop.wait(interval):
+                try:
+                    cls._maybe_refresh(config_filepath)
+                except Exception as e:
+                    logger.error(f"Scheduled token refresh failed: {e}")
+
+        cls._scheduler_stop.clear()
+        cls._scheduler_thread = threading.Thread(
+            target=_run, name="whoop-token-refresh", daemon=True
         )
+        cls._scheduler_thread.start()
+        logger.info("Token refresh scheduler started.")
 
-        params["access_token"] = res.json().get("access_token")
-        params["refresh_token"] = res.json().get("refresh_token")
+    @classmethod
+    def stop_refresh_scheduler(cls) -> None:
+        """Stops the background refresh thread, if running."""
+        cls._scheduler_stop.set()
+        if cls._scheduler_thread is not None:
+            cls._scheduler_thread.join()
+            cls._scheduler_thread = None
+
+    @classmethod
+    def _page_params(
+        cls,
+        record_type: str,
+        next_token: str | None,
+        start: str | None = None,
+        end: str | None = None,
+    ) -> dict | None:
+        # profile is a single object rather than a paginated collection
+        if record_type == "profile":
+            return None
+
+        params = {"limit": cls._PAGE_LIMIT}
+        if start is not None:
+            params["start"] = start
+        if end is not None:
+            params["end"] = end
+        if next_token is not None:
+            params["nextToken"] = next_token
+        return params
+
+    @classmethod
+    def _parse_page(
+        cls, record_type: str, res: "requests.Response | httpx.Response"
+    ) -> tuple[list[dict] | None, str | None]:
+        """
+        Parses a page response into (records, next_token). records is None if the request
+        failed, in which case the error is logged.
+        """
+        if res.status_code != 200:
+            logger.error(f"Error fetching {record_type} records: {res.text}")
+            return None, None
 
-        with open(config_filepath, "w") as f:
-            json.dump(params, f, indent=4)
+        body = orjson.loads(res.content)
+        if record_type == "profile":
+            return [body], None
+        return body.get("records", []), body.get("next_token")
 
     @classmethod
-    def get_records(cls, record_type: str, config_filepath: str) -> list[dict]:
+    def iter_records(
+        cls,
+        record_type: str,
+        config_filepath: str = "config.json",
+        start: str | None = None,
+        end: str | None = None,
+        max_pages: int | None = None,
+    ) -> Iterator[dict]:
+        """
+        Yields records of the given type, following WHOOP's next_token pagination one page
+        at a time so callers can stop early without fetching the full history.
+
+        start/end (ISO 8601 datetimes) bound the window server-side and max_pages caps the
+        number of requests; with neither, the full history is paged through.
+        """
         # set url based on record
-        if record_type == "sleep":
-            url = f"{cls.BASE_URL}/activity/sleep"
-        elif record_type == "workout":
-            url = f"{cls.BASE_URL}/activity/workout"
-        elif record_type == "profile":
-            url = f"{cls.BASE_URL}/user/profile/basic"
-        elif record_type == "recovery":
-            url = f"{cls.BASE_URL}/recovery"
-        else:
+        url = cls._RECORD_URLS.get(record_type)
+        if url is None:
             logger.error(f"Invalid record type: {record_type}")
+            return
 
-        res = requests.get(
-            url=url,
-            headers={
-                "Authorization": f"Bearer {cls._fetch_access_token(config_filepath)}"
-            },
-        )
+        next_token = None
+        pages = 0
+        while True:
+            params = cls._page_params(record_type, next_token, start, end)
 
-        if res.status_code == 401:
-            logger.warning("Access token expired, refreshing...")
-            cls.refresh_access_tokens(config_filepath)
-            res = requests.get(
-                url=url,
-                headers={
-                    "Authorization": f"Bearer {cls._fetch_access_token(config_filepath)}"
-                },
+            # refresh up front if the token is about to expire, rather than learning via a 401
+            cls._maybe_refresh(config_filepath)
+
+            res = cls._get_session().get(
+                url=url, params=params, headers=cls._get_auth_header(config_filepath)
             )
 
-        if res.status_code != 200:
-            logger.error(f"Error fetching {record_type} records: {res.text}")
+            # fallback for tokens revoked/expired despite the pre-flight check
+            if res.status_code == 401:
+                logger.warning("Access token expired, refreshing...")
+                cls.refresh_access_tokens(config_filepath)
+                res = cls._get_session().get(
+                    url=url,
+                    params=params,
+                    headers=cls._get_auth_header(config_filepath),
+                )
+
+            records, next_token = cls._parse_page(record_type, res)
+            if records is None:
+                return
+
+            yield from records
+
+            pages += 1
+            if next_token is None or (max_pages is not None and pages >= max_pages):
+                return
+
+    @classmethod
+    def get_records(
+        cls,
+        record_type: str,
+        config_filepath: str,
+        start: str | None = None,
+        end: str | None = None,
+        max_pages: int | None = 1,
+    ) -> list[dict]:
+        """
+        Returns records of the given type. By default only the most recent page is fetched;
+        pass start/end to target a window, and max_pages=None to page through all of it.
+        """
+        return list(
+            cls.iter_records(record_type, config_filepath, start, end, max_pages)
+        )
+
+    @classmethod
+    def get_all_records(
+        cls,
+        record_types: list[str],
+        config_filepath: str = "config.json",
+        start: str | None = None,
+        end: str | None = None,
+        max_pages: int | None = 1,
+    ) -> dict[str, list[dict]]:
+        """
+        Fetches several record types concurrently, returning a dict keyed by record type.
+        Requests share the pooled session, so wall time is roughly that of the slowest call.
+
+        Concurrent 401s are safe: refresh_access_tokens deduplicates simultaneous refreshes.
+        """
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = {
+                record_type: executor.submit(
+                    cls.get_records,
+                    record_type,
+                    config_filepath,
+                    start,
+                    end,
+                    max_pages,
+                )
+                for record_type in record_types
+            }
+            return {
+                record_type: future.result() for record_type, future in futures.items()
+            }
+
+    @classmethod
+    async def a_get_records(
+        cls,
+        record_type: str,
+        config_filepath: str = "config.json",
+        start: str | None = None,
+        end: str | None = None,
+        max_pages: int | None = 1,
+        client: "httpx.AsyncClient | None" = None,
+    ) -> list[dict]:
+        """
+        Async version of get_records. Pass a client to share one connection pool across
+        calls on the same event loop; otherwise a client is opened for this call.
+        """
+        if client is None:
+            async with cls._new_async_client() as client:
+                return await cls.a_get_records(
+                    record_type, config_filepath, start, end, max_pages, client
+                )
+
+        url = cls._RECORD_URLS.get(record_type)
+        if url is None:
+            logger.error(f"Invalid record type: {record_type}")
             return []
-        else:
-            if record_type == "profile":
-                return [res.json()]
-            return res.json().get("records", [])
+
+        records = []
+        next_token = None
+        pages = 0
+        while True:
+            params = cls._page_params(record_type, next_token, start, end)
+
+            # refresh up front if the token is about to expire, rather than learning via a 401
+            if cls._needs_refresh(config_filepath):
+                logger.info("Access token near expiry, refreshing...")
+                await cls.a_refresh_access_tokens(config_filepath)
+
+            res = await client.get(
+                url, params=params, headers=cls._get_auth_header(config_filepath)
+            )
+
+            # fallback for tokens revoked/expired despite the pre-flight check
+            if res.status_code == 401:
+                logger.warning("Access token expired, refreshing...")
+                await cls.a_refresh_access_tokens(config_filepath)
+                res = await client.get(
+                    url, params=params, headers=cls._get_auth_header(config_filepath)
+                )
+
+            page, next_token = cls._parse_page(record_type, res)
+            if page is None:
+                return records
+
+            records.extend(page)
+
+            pages += 1
+            if next_token is None or (max_pages is not None and pages >= max_pages):
+                return records
+
+    @classmethod
+    async def a_get_all_records(
+        cls,
+        record_types: list[str],
+        config_filepath: str = "config.json",
+        start: str | None = None,
+        end: str | None = None,
+        max_pages: int | None = 1,
+    ) -> dict[str, list[dict]]:
+        """Async version of get_all_records, gathering every fetch on one shared client."""
+        async with cls._new_async_client() as client:
+            results = await asyncio.gather(
+                *[
+                    cls.a_get_records(
+                        record_type, config_filepath, start, end, max_pages, client
+                    )
+                    for record_type in record_types
+                ]
+            )
+        return dict(zip(record_types, results))